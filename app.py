@@ -6,15 +6,38 @@ Stock Technical Analyzer - Streamlit Web UI
     streamlit run app.py
 """
 
+import io
+import math
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 import streamlit as st
 import yfinance as yf
 import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
+
+# numba はオプション（指標計算の高速化用）
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """numba 未導入時は関数をそのまま返す"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
 
 # ─── ページ設定 ─────────────────────────────────────────
 st.set_page_config(
@@ -49,10 +72,55 @@ COLORS = {
 
 CHART_COLORS = ['#00d4ff', '#ff6b6b', '#ffd93d', '#6bcb77', '#c084fc', '#fb923c']
 
+# トレンド判定表: インデックスは (sign(終値-SMA10)+1)*3 + (sign(SMA10-SMA30)+1)
+TRENDS = (
+    ("📉 強い下降トレンド", "trend-bearish"),
+    ("📉 下降トレンド", "trend-bearish"),
+    ("📉 下降トレンド", "trend-bearish"),
+    ("➡️ 横ばい", "trend-neutral"),
+    ("➡️ 横ばい", "trend-neutral"),
+    ("➡️ 横ばい", "trend-neutral"),
+    ("📊 上昇トレンド", "trend-bullish"),
+    ("📊 上昇トレンド", "trend-bullish"),
+    ("📈 強い上昇トレンド", "trend-bullish"),
+)
+
+
+def trend_code(latest, sma10, sma30):
+    """TRENDS のインデックスを分岐なしで求める（NumPy 配列にもそのまま使える）"""
+    return (np.sign(latest - sma10).astype(int) + 1) * 3 + np.sign(sma10 - sma30).astype(int) + 1
+
+
+# 1系列あたりの最大描画点数（画面解像度で見分けがつかない程度）
+MAX_PLOT_POINTS = 2000
+
+# チャート PNG の解像度と表示幅（figsize × dpi で出力サイズが決まる）
+CHART_DPI = 96
+CHART_DISPLAY_WIDTH = 1200
+
+# pandas 2.x の concat は copy=False を渡さないと元の列もコピーする（3.x は Copy-on-Write で不要、引数も非推奨）
+CONCAT_KWARGS = {'copy': False} if int(pd.__version__.split('.')[0]) < 3 else {}
+
 # 日本語フォント
 plt.rcParams['font.sans-serif'] = ['Meiryo', 'Yu Gothic', 'MS Gothic', 'Segoe UI Symbol']
 plt.rcParams['axes.unicode_minus'] = False
 
+# 軸のダークテーマ（Axes 生成時に既定値として適用される）
+plt.rcParams.update({
+    'axes.facecolor': COLORS['panel'],
+    'axes.edgecolor': COLORS['grid'],
+    'axes.spines.top': False,
+    'axes.spines.right': False,
+    'axes.grid': True,
+    'grid.color': COLORS['grid'],
+    'grid.alpha': 0.15,
+    'grid.linestyle': '--',
+    'xtick.color': COLORS['text'],
+    'ytick.color': COLORS['text'],
+    'xtick.labelsize': 9,
+    'ytick.labelsize': 9,
+})
+
 # ─── カスタム CSS ──────────────────────────────────────
 st.markdown("""
 <style>
@@ -60,6 +128,11 @@ st.markdown("""
 
     .stApp { font-family: 'Inter', sans-serif; }
 
+    .metric-grid {
+        display: grid;
+        grid-template-columns: repeat(5, 1fr);
+        gap: 12px;
+    }
     .metric-card {
         background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%);
         border: 1px solid #2a2a4a;
@@ -115,178 +188,519 @@ st.markdown("""
 
 
 # ─── データ取得 ─────────────────────────────────────────
-@st.cache_data(ttl=300)
-def fetch_stock_data(ticker, period):
-    """Yahoo Financeからデータ取得（5分キャッシュ）"""
+# 直近の値動きが主役になる短期間はディスクに残さずメモリで5分だけ保持
+SHORT_PERIODS = ('1d', '5d')
+
+
+def _download_history(ticker, period):
+    """Yahoo Financeからデータ取得"""
     stock = yf.Ticker(ticker)
-    data = stock.history(period=period)
-    return data
+    return stock.history(period=period)
 
 
-def calculate_indicators(data):
-    """テクニカル指標を計算"""
-    df = data.copy()
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_stock_data_recent(ticker, period):
+    """短期間のデータ取得（5分キャッシュ）"""
+    return _download_history(ticker, period)
 
-    # SMA
-    df['SMA_10'] = df['Close'].rolling(window=10).mean()
-    df['SMA_30'] = df['Close'].rolling(window=30).mean()
-    df['SMA_60'] = df['Close'].rolling(window=60).mean()
 
-    # ボラティリティ
-    df['Volatility'] = df['Close'].rolling(window=20).std()
+@st.cache_data(persist="disk", max_entries=100, show_spinner=False)
+def fetch_stock_data_long(ticker, period, as_of):
+    """長期間のデータ取得（ディスクキャッシュ、as_of の日付ごとに更新）"""
+    return _download_history(ticker, period)
 
+
+@st.cache_resource(show_spinner=False)
+def long_cache_state():
+    """ディスクキャッシュを最後に使った日付（再実行・全セッションで共有、更新時は lock を取得）"""
+    return {'day': None, 'lock': threading.Lock()}
+
+
+def fetch_stock_data(ticker, period):
+    """期間に応じてキャッシュ方式を切り替えてデータ取得"""
+    if period in SHORT_PERIODS:
+        return fetch_stock_data_recent(ticker, period)
+    # persist="disk" では ttl が無視されるため、日付をキーに含めて1日で切り替える
+    # max_entries はメモリ側にしか効かないので、日付が変わったら前日までのファイルを消す
+    today = datetime.now().strftime('%Y-%m-%d')
+    state = long_cache_state()
+    with state['lock']:
+        if state['day'] is not None and state['day'] != today:
+            fetch_stock_data_long.clear()
+        state['day'] = today
+    return fetch_stock_data_long(ticker, period, today)
+
+
+def _macd(close):
+    """MACD・シグナル・ヒストグラムを計算"""
+    exp1 = close.ewm(span=12, adjust=False).mean()
+    exp2 = close.ewm(span=26, adjust=False).mean()
+    macd = exp1 - exp2
+    signal = macd.ewm(span=9, adjust=False).mean()
+    return macd, signal, macd - signal
+
+
+def _indicators_pandas(close):
+    """pandas の rolling / ewm で指標を計算"""
     # RSI
-    delta = df['Close'].diff()
+    delta = close.diff()
     gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
     loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
     rs = gain / loss
-    df['RSI'] = 100 - (100 / (1 + rs))
-
-    # MACD
-    exp1 = df['Close'].ewm(span=12, adjust=False).mean()
-    exp2 = df['Close'].ewm(span=26, adjust=False).mean()
-    df['MACD'] = exp1 - exp2
-    df['Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-    df['Histogram'] = df['MACD'] - df['Signal']
 
     # ボリンジャーバンド
     bb_period = 20
-    df['BB_Middle'] = df['Close'].rolling(window=bb_period).mean()
-    bb_std = df['Close'].rolling(window=bb_period).std()
-    df['BB_Upper'] = df['BB_Middle'] + (bb_std * 2)
-    df['BB_Lower'] = df['BB_Middle'] - (bb_std * 2)
+    bb_middle = close.rolling(window=bb_period).mean()
+    bb_std = close.rolling(window=bb_period).std()
+
+    macd, signal, hist = _macd(close)
+    return {
+        'SMA_10': close.rolling(window=10).mean(),
+        'SMA_30': close.rolling(window=30).mean(),
+        'SMA_60': close.rolling(window=60).mean(),
+        'Volatility': close.rolling(window=20).std(),
+        'RSI': 100 - (100 / (1 + rs)),
+        'MACD': macd,
+        'Signal': signal,
+        'Histogram': hist,
+        'BB_Middle': bb_middle,
+        'BB_Upper': bb_middle + (bb_std * 2),
+        'BB_Lower': bb_middle - (bb_std * 2),
+    }
 
-    return df
 
+@njit(cache=True)
+def _ewm_step(weighted, old_wt, cur, alpha):
+    """adjust=False の EWM を1要素進める（NaN の扱いは pandas と同じ）"""
+    if np.isnan(weighted):
+        return cur, 1.0
+    old_wt *= 1.0 - alpha
+    if not np.isnan(cur):
+        weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+        old_wt = 1.0
+    return weighted, old_wt
+
+
+@njit(cache=True)
+def _indicator_kernel(close):
+    """終値を1回走査して全指標を計算（定義は pandas 版と同一）"""
+    n = close.shape[0]
+
+    # SMA 10 / 30 / 60 / 20（ウィンドウ内の合計を差分更新）
+    windows = np.array([10, 30, 60, 20])
+    sma = np.full((4, n), np.nan)
+    sums = np.zeros(4)
+    nan_counts = np.zeros(4, dtype=np.int64)
+
+    # 20日標準偏差（Welford 法で追加・削除）
+    std20 = np.full(n, np.nan)
+    count, mean, m2 = 0, 0.0, 0.0
+
+    # RSI（14日の上昇幅・下落幅の合計）
+    rsi = np.full(n, np.nan)
+    gains = np.zeros(n)
+    losses = np.zeros(n)
+    gain_sum, loss_sum = 0.0, 0.0
+    gain_count, loss_count = 0, 0
 
-def style_axis(ax):
-    """軸のダークテーマスタイリング"""
-    ax.set_facecolor(COLORS['panel'])
-    ax.tick_params(colors=COLORS['text'], labelsize=9)
-    ax.spines['top'].set_visible(False)
-    ax.spines['right'].set_visible(False)
-    ax.spines['bottom'].set_color(COLORS['grid'])
-    ax.spines['left'].set_color(COLORS['grid'])
-    ax.grid(True, alpha=0.15, color=COLORS['grid'], linestyle='--')
+    # MACD
+    macd = np.empty(n)
+    signal = np.empty(n)
+    ema12, wt12 = np.nan, 1.0
+    ema26, wt26 = np.nan, 1.0
+    ema9, wt9 = np.nan, 1.0
+
+    for i in range(n):
+        x = close[i]
+
+        for j in range(4):
+            w = windows[j]
+            if np.isnan(x):
+                nan_counts[j] += 1
+            else:
+                sums[j] += x
+            if i >= w:
+                old = close[i - w]
+                if np.isnan(old):
+                    nan_counts[j] -= 1
+                else:
+                    sums[j] -= old
+            if i >= w - 1 and nan_counts[j] == 0:
+                sma[j, i] = sums[j] / w
+
+        if not np.isnan(x):
+            count += 1
+            d = x - mean
+            mean += d / count
+            m2 += d * (x - mean)
+        if i >= 20:
+            old = close[i - 20]
+            if not np.isnan(old):
+                count -= 1
+                if count == 0:
+                    mean, m2 = 0.0, 0.0
+                else:
+                    d = old - mean
+                    mean -= d / count
+                    m2 -= d * (old - mean)
+        if count == 20:
+            std20[i] = np.sqrt(max(m2, 0.0) / 19)
+
+        if i > 0:
+            d = x - close[i - 1]
+            if d > 0:
+                gains[i] = d
+                gain_sum += d
+                gain_count += 1
+            elif d < 0:
+                losses[i] = -d
+                loss_sum -= d
+                loss_count += 1
+        if i >= 14:
+            if gains[i - 14] > 0:
+                gain_sum -= gains[i - 14]
+                gain_count -= 1
+            if losses[i - 14] > 0:
+                loss_sum -= losses[i - 14]
+                loss_count -= 1
+        # 差分更新の丸め誤差がゼロ判定に残らないようリセット
+        if gain_count == 0:
+            gain_sum = 0.0
+        if loss_count == 0:
+            loss_sum = 0.0
+        if i >= 13:
+            if loss_sum > 0:
+                rsi[i] = 100 - (100 / (1 + gain_sum / loss_sum))
+            elif gain_sum > 0:
+                rsi[i] = 100.0
+
+        ema12, wt12 = _ewm_step(ema12, wt12, x, 2 / 13)
+        ema26, wt26 = _ewm_step(ema26, wt26, x, 2 / 27)
+        macd[i] = ema12 - ema26
+        ema9, wt9 = _ewm_step(ema9, wt9, macd[i], 2 / 10)
+        signal[i] = ema9
+
+    bb_upper = sma[3] + std20 * 2
+    bb_lower = sma[3] - std20 * 2
+    return (sma[0], sma[1], sma[2], std20, rsi,
+            macd, signal, macd - signal, sma[3], bb_upper, bb_lower)
+
+
+def _indicators_numba(close):
+    """numba カーネルで指標を計算"""
+    names = ('SMA_10', 'SMA_30', 'SMA_60', 'Volatility', 'RSI',
+             'MACD', 'Signal', 'Histogram', 'BB_Middle', 'BB_Upper', 'BB_Lower')
+    columns = _indicator_kernel(close.to_numpy(dtype=np.float64))
+    return dict(zip(names, columns))
 
 
-def create_single_chart(data, ticker):
-    """単一銘柄のチャート生成"""
-    fig, axes = plt.subplots(4, 1, figsize=(14, 14),
-                             gridspec_kw={'height_ratios': [3, 1, 1.5, 1.5]})
+def calculate_indicators(data):
+    """テクニカル指標を計算（numba があれば使用）"""
+    if HAS_NUMBA:
+        indicators = _indicators_numba(data['Close'])
+    else:
+        indicators = _indicators_pandas(data['Close'])
+
+    # 元の OHLCV はコピーせず、新しい列だけを確保して横に連結する
+    # SMA・MACD は表やメトリクスに表示するため、高額銘柄でも桁が狂わないよう float64 のまま持つ
+    new_cols = pd.DataFrame(indicators, index=data.index)
+    return pd.concat([data, new_cols], axis=1, **CONCAT_KWARGS)
+
+
+# 比較モードではワーカースレッドから呼ぶため、キャッシュ側のスピナーは出さない（呼び出し側で表示）
+@st.cache_data(ttl=300, show_spinner=False)
+def get_analyzed_data(ticker, period):
+    """データ取得とテクニカル指標計算（5分キャッシュ）"""
+    data = fetch_stock_data(ticker, period)
+    if data.empty:
+        return data
+    return calculate_indicators(data)
+
+
+@st.cache_data(ttl=300)
+def summary_stats(ticker, period):
+    """メトリクスカード用のスカラー値をまとめて計算（5分キャッシュ）"""
+    data = get_analyzed_data(ticker, period)
+    # 最終行はまとめて一度だけ取り出し、以降はスカラーとして扱う
+    last = data.iloc[-1].to_dict()
+    latest = float(last['Close'])
+    prev = float(data['Close'].iat[-2]) if len(data) > 1 else latest
+    return {
+        'latest': latest,
+        'change': latest - prev,
+        'change_pct': (latest - prev) / prev * 100,
+        'period_return': (latest / float(data['Close'].iat[0]) - 1) * 100,
+        'rsi': float(last['RSI']),
+        'macd': float(last['MACD']),
+        'signal': float(last['Signal']),
+        'sma10': float(last['SMA_10']),
+        'sma30': float(last['SMA_30']),
+        'vol_mean': float(data['Volume'].mean()),
+    }
+
+
+@njit(cache=True)
+def _lttb_kernel(y, n_out):
+    """LTTB (Largest-Triangle-Three-Buckets) で残す点のインデックスを選ぶ"""
+    n = y.shape[0]
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0] = 0
+    idx[n_out - 1] = n - 1
+    bucket = (n - 2) / (n_out - 2)
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * bucket) + 1
+        end = int((i + 1) * bucket) + 1
+        next_end = min(int((i + 2) * bucket) + 1, n)
+        avg_x = (end + next_end - 1) / 2
+        avg_y = y[end:next_end].mean()
+        xs = np.arange(start, end)
+        area = np.abs((a - avg_x) * (y[start:end] - y[a]) - (a - xs) * (avg_y - y[a]))
+        a = start + np.argmax(area)
+        idx[i + 1] = a
+    return idx
+
+
+def lttb_indices(values, n_out=MAX_PLOT_POINTS):
+    """折れ線の形を保ったまま n_out 点に間引くためのインデックス"""
+    y = np.nan_to_num(np.asarray(values, dtype=np.float64))
+    if len(y) <= n_out:
+        return np.arange(len(y))
+    return _lttb_kernel(y, n_out)
+
+
+def peak_indices(values, n_out=MAX_PLOT_POINTS):
+    """棒グラフ用に、ブロックごとに絶対値最大の要素を残すインデックスとブロック幅"""
+    a = np.abs(np.nan_to_num(np.asarray(values, dtype=np.float64)))
+    n = len(a)
+    if n <= n_out:
+        return np.arange(n), 1
+    block = -(-n // n_out)
+    a = np.pad(a, (0, (-n) % block), constant_values=-1.0)
+    idx = a.reshape(-1, block).argmax(axis=1) + np.arange(0, len(a), block)
+    return idx, block
+
+
+def block_bars(x, block):
+    """peak_indices と同じブロック分けで、棒の位置（ブロック内の x の平均）と幅を返す"""
+    if block == 1:
+        return x, 0.8
+    starts = np.arange(0, len(x), block)
+    counts = np.diff(np.append(starts, len(x)))
+    return np.add.reduceat(x, starts) / counts, 0.8 * counts
+
+
+@st.cache_resource
+def single_chart_figure():
+    """単一銘柄チャートの Figure を一度だけ構築（全セッションで共有、描画時は lock を取得）"""
+    fig = Figure(figsize=(14, 14))
     fig.patch.set_facecolor(COLORS['bg'])
+    axes = fig.subplots(4, 1, gridspec_kw={'height_ratios': [3, 1, 1.5, 1.5]})
     for ax in axes:
-        style_axis(ax)
+        ax.xaxis_date()
+        ax.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
+    ax1, ax2, ax3, ax4 = axes
+
+    lines = {
+        'close': ax1.plot([], [], label='終値', color=COLORS['price'], linewidth=2)[0],
+        'sma10': ax1.plot([], [], label='SMA 10', color=COLORS['sma10'], alpha=0.8, linewidth=1.2)[0],
+        'sma30': ax1.plot([], [], label='SMA 30', color=COLORS['sma30'], alpha=0.8, linewidth=1.2)[0],
+        'bb_upper': ax1.plot([], [], color=COLORS['bb_fill'], alpha=0.3, linewidth=0.8, linestyle='--')[0],
+        'bb_lower': ax1.plot([], [], color=COLORS['bb_fill'], alpha=0.3, linewidth=0.8, linestyle='--')[0],
+        'rsi': ax3.plot([], [], color=COLORS['rsi'], linewidth=1.5)[0],
+        'macd': ax4.plot([], [], label='MACD', color=COLORS['macd'], linewidth=1.5)[0],
+        'signal': ax4.plot([], [], label='Signal', color=COLORS['signal'], linewidth=1.5)[0],
+    }
 
     # 価格チャート
-    ax1 = axes[0]
-    ax1.plot(data.index, data['Close'], label='終値', color=COLORS['price'], linewidth=2)
-    ax1.plot(data.index, data['SMA_10'], label='SMA 10', color=COLORS['sma10'], alpha=0.8, linewidth=1.2)
-    ax1.plot(data.index, data['SMA_30'], label='SMA 30', color=COLORS['sma30'], alpha=0.8, linewidth=1.2)
-    ax1.fill_between(data.index, data['BB_Upper'], data['BB_Lower'],
-                     alpha=0.08, color=COLORS['bb_fill'], label='Bollinger Bands')
-    ax1.plot(data.index, data['BB_Upper'], color=COLORS['bb_fill'], alpha=0.3, linewidth=0.8, linestyle='--')
-    ax1.plot(data.index, data['BB_Lower'], color=COLORS['bb_fill'], alpha=0.3, linewidth=0.8, linestyle='--')
+    bb_patch = Patch(facecolor=COLORS['bb_fill'], alpha=0.08, label='Bollinger Bands')
     ax1.set_ylabel('価格 (USD)', color=COLORS['text'])
     ax1.set_title('価格・移動平均線・ボリンジャーバンド', fontsize=12, fontweight='bold', color=COLORS['text'], pad=10)
-    ax1.legend(loc='upper left', fontsize=8, facecolor=COLORS['panel'], edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
-    ax1.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
+    ax1.legend(handles=[lines['close'], lines['sma10'], lines['sma30'], bb_patch],
+               loc='upper left', fontsize=8, facecolor=COLORS['panel'], edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
 
     # 出来高
-    ax2 = axes[1]
-    vol_colors = [COLORS['vol_up'] if data['Close'].iloc[i] >= data['Open'].iloc[i]
-                  else COLORS['vol_down'] for i in range(len(data))]
-    ax2.bar(data.index, data['Volume'], color=vol_colors, alpha=0.7, width=0.8)
     ax2.set_ylabel('出来高', color=COLORS['text'])
     ax2.set_title('出来高 (Volume)', fontsize=12, fontweight='bold', color=COLORS['text'], pad=10)
     ax2.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x/1e6:.0f}M'))
-    ax2.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
     # RSI
-    ax3 = axes[2]
-    ax3.plot(data.index, data['RSI'], color=COLORS['rsi'], linewidth=1.5)
+    ax3.set_ylabel('RSI', color=COLORS['text'])
+    ax3.set_title('相対力指数 (RSI)', fontsize=12, fontweight='bold', color=COLORS['text'], pad=10)
+    ax3.set_ylim([0, 100])
+    # 閾値の線・帯は銘柄によらず固定なので構築時に一度だけ追加
     ax3.axhline(y=70, color=COLORS['overbought'], linestyle='--', alpha=0.6)
     ax3.axhline(y=30, color=COLORS['oversold'], linestyle='--', alpha=0.6)
     ax3.axhspan(70, 100, alpha=0.05, color=COLORS['overbought'])
     ax3.axhspan(0, 30, alpha=0.05, color=COLORS['oversold'])
-    ax3.set_ylabel('RSI', color=COLORS['text'])
-    ax3.set_title('相対力指数 (RSI)', fontsize=12, fontweight='bold', color=COLORS['text'], pad=10)
-    ax3.set_ylim([0, 100])
-    ax3.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
     # MACD
-    ax4 = axes[3]
-    ax4.plot(data.index, data['MACD'], label='MACD', color=COLORS['macd'], linewidth=1.5)
-    ax4.plot(data.index, data['Signal'], label='Signal', color=COLORS['signal'], linewidth=1.5)
-    hist = data['Histogram']
-    ax4.bar(data.index, hist.where(hist >= 0), color=COLORS['hist_pos'], alpha=0.5, width=0.8)
-    ax4.bar(data.index, hist.where(hist < 0), color=COLORS['hist_neg'], alpha=0.5, width=0.8)
     ax4.set_ylabel('MACD', color=COLORS['text'])
     ax4.set_title('MACD', fontsize=12, fontweight='bold', color=COLORS['text'], pad=10)
     ax4.legend(loc='upper left', fontsize=8, facecolor=COLORS['panel'], edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
-    ax4.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
-    plt.tight_layout()
-    return fig
+    # レイアウトは固定なので tight_layout を毎回走らせず余白を直接指定
+    fig.subplots_adjust(left=0.06, right=0.98, top=0.96, bottom=0.05, hspace=0.35)
+
+    return {'fig': fig, 'axes': axes, 'lines': lines, 'transient': [], 'lock': threading.Lock()}
+
+
+def create_single_chart(data, ticker):
+    """単一銘柄のチャート生成（共有 Figure の線データを更新）"""
+    chart = single_chart_figure()
+    ax1, ax2, ax3, ax4 = chart['axes']
+    lines = chart['lines']
+
+    # 前回の描画で追加した棒・塗りつぶしなどを削除
+    for artist in chart['transient']:
+        artist.remove()
+    transient = chart['transient'] = []
+
+    # 日付→数値の変換は一度だけ行い、各プロットで使い回す
+    x = mdates.date2num(data.index)
+
+    # 長期間のデータは軸ごとに間引いて描画
+    price_idx = lttb_indices(data['Close'])
+    rsi_idx = lttb_indices(data['RSI'])
+    macd_idx = lttb_indices(data['MACD'])
+    vol_idx, vol_block = peak_indices(data['Volume'])
+    hist_idx, hist_block = peak_indices(data['Histogram'])
+    price = data.iloc[price_idx]
+    macd = data.iloc[macd_idx]
+    price_x = x[price_idx]
+    macd_x = x[macd_idx]
+
+    lines['close'].set_data(price_x, price['Close'])
+    lines['sma10'].set_data(price_x, price['SMA_10'])
+    lines['sma30'].set_data(price_x, price['SMA_30'])
+    lines['bb_upper'].set_data(price_x, price['BB_Upper'])
+    lines['bb_lower'].set_data(price_x, price['BB_Lower'])
+    lines['rsi'].set_data(x[rsi_idx], data['RSI'].to_numpy()[rsi_idx])
+    lines['macd'].set_data(macd_x, macd['MACD'])
+    lines['signal'].set_data(macd_x, macd['Signal'])
+
+    # 線だけの状態でデータ範囲を再計算（棒などは追加時に範囲へ反映される）
+    for ax in chart['axes']:
+        ax.relim()
+
+    # 価格チャート
+    transient.append(ax1.fill_between(price_x, price['BB_Upper'], price['BB_Lower'],
+                                      alpha=0.08, color=COLORS['bb_fill']))
+
+    # 出来高
+    vol_colors = np.where(data['Close'].to_numpy() >= data['Open'].to_numpy(),
+                          COLORS['vol_up'], COLORS['vol_down'])
+    # 高さと色はブロック内のピーク、位置と幅はブロックから決める（隣り合うブロックの棒が重ならない）
+    vol_x, vol_width = block_bars(x, vol_block)
+    transient.append(ax2.bar(vol_x, data['Volume'].to_numpy()[vol_idx], color=vol_colors[vol_idx],
+                             alpha=0.7, width=vol_width))
+
+    # MACD
+    hist = data['Histogram'].to_numpy()[hist_idx]
+    hist_colors = np.where(hist >= 0, COLORS['hist_pos'], COLORS['hist_neg'])
+    hist_x, hist_width = block_bars(x, hist_block)
+    transient.append(ax4.bar(hist_x, hist, color=hist_colors,
+                             alpha=0.5, width=hist_width))
+
+    for ax in chart['axes']:
+        ax.autoscale_view()
+    return chart['fig']
+
+
+def plot_line_collection(ax, series, linewidth, alpha=1.0):
+    """銘柄ごとの (x, y) 系列を1つの LineCollection で描画し、凡例を付ける"""
+    colors = [CHART_COLORS[i % len(CHART_COLORS)] for i in range(len(series))]
+    segments = [np.column_stack([x, y]) for x, y in series.values()]
+    ax.add_collection(LineCollection(segments, colors=colors, linewidths=linewidth, alpha=alpha))
+    ax.xaxis_date()
+    ax.autoscale_view()
+    handles = [Line2D([], [], color=c, linewidth=linewidth, alpha=alpha, label=ticker)
+               for ticker, c in zip(series, colors)]
+    ax.legend(handles=handles, facecolor=COLORS['panel'], edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
 
 
 def create_comparison_chart(all_data, tickers):
     """複数銘柄の比較チャート生成"""
     fig, axes = plt.subplots(2, 2, figsize=(16, 10))
     fig.patch.set_facecolor(COLORS['bg'])
-    for ax in axes.flat:
-        style_axis(ax)
+
+    # 日付の数値化は銘柄ごとに一度だけ行い、4つのサブプロットで共有する
+    norm, rsi, ret, cum = {}, {}, {}, {}
+    for ticker, data in all_data.items():
+        x = mdates.date2num(data.index)
+        close = data['Close'].to_numpy(dtype=np.float64)
+        series = (
+            (norm, (close / close[0]) * 100),
+            (rsi, data['RSI'].to_numpy(dtype=np.float64)),
+            (ret, data['Close'].pct_change().to_numpy(dtype=np.float64) * 100),
+            (cum, ((close / close[0]) - 1) * 100),
+        )
+        for store, y in series:
+            idx = lttb_indices(y)
+            store[ticker] = (x[idx], y[idx])
 
     # 正規化価格
     ax1 = axes[0, 0]
-    for i, (ticker, data) in enumerate(all_data.items()):
-        norm = (data['Close'] / data['Close'].iloc[0]) * 100
-        ax1.plot(data.index, norm, label=ticker, color=CHART_COLORS[i % len(CHART_COLORS)], linewidth=2)
+    plot_line_collection(ax1, norm, linewidth=2)
     ax1.set_title('正規化価格 (初日=100)', fontsize=12, fontweight='bold', color=COLORS['text'])
-    ax1.legend(facecolor=COLORS['panel'], edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
     ax1.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
     # RSI比較
     ax2 = axes[0, 1]
-    for i, (ticker, data) in enumerate(all_data.items()):
-        delta = data['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
-        rsi = 100 - (100 / (1 + gain / loss))
-        ax2.plot(data.index, rsi, label=ticker, color=CHART_COLORS[i % len(CHART_COLORS)], linewidth=1.5)
+    plot_line_collection(ax2, rsi, linewidth=1.5)
     ax2.axhline(70, color=COLORS['overbought'], linestyle='--', alpha=0.5)
     ax2.axhline(30, color=COLORS['oversold'], linestyle='--', alpha=0.5)
     ax2.set_title('RSI 比較', fontsize=12, fontweight='bold', color=COLORS['text'])
     ax2.set_ylim([0, 100])
-    ax2.legend(facecolor=COLORS['panel'], edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
     ax2.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
     # 日次リターン
     ax3 = axes[1, 0]
-    for i, (ticker, data) in enumerate(all_data.items()):
-        ret = data['Close'].pct_change() * 100
-        ax3.plot(data.index, ret, label=ticker, color=CHART_COLORS[i % len(CHART_COLORS)], linewidth=1, alpha=0.8)
+    plot_line_collection(ax3, ret, linewidth=1, alpha=0.8)
     ax3.axhline(0, color=COLORS['text'], linestyle='-', alpha=0.3)
     ax3.set_title('日次リターン (%)', fontsize=12, fontweight='bold', color=COLORS['text'])
-    ax3.legend(facecolor=COLORS['panel'], edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
     ax3.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
     # 累積リターン
     ax4 = axes[1, 1]
-    for i, (ticker, data) in enumerate(all_data.items()):
-        cum = ((data['Close'] / data['Close'].iloc[0]) - 1) * 100
-        ax4.plot(data.index, cum, label=ticker, color=CHART_COLORS[i % len(CHART_COLORS)], linewidth=2)
-        ax4.annotate(f'{cum.iloc[-1]:+.1f}%', xy=(data.index[-1], cum.iloc[-1]),
+    plot_line_collection(ax4, cum, linewidth=2)
+    for i, (ticker, (x, c)) in enumerate(cum.items()):
+        ax4.annotate(f'{c[-1]:+.1f}%', xy=(x[-1], c[-1]),
                      fontsize=9, color=CHART_COLORS[i % len(CHART_COLORS)], fontweight='bold')
     ax4.axhline(0, color=COLORS['text'], linestyle='-', alpha=0.3)
     ax4.set_title('累積リターン (%)', fontsize=12, fontweight='bold', color=COLORS['text'])
-    ax4.legend(facecolor=COLORS['panel'], edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
     ax4.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
-    plt.tight_layout()
+    fig.subplots_adjust(left=0.05, right=0.98, top=0.95, bottom=0.06, hspace=0.22, wspace=0.15)
     return fig
 
 
+def figure_to_png(fig):
+    """Figure を固定 dpi で PNG バイト列にラスタライズ（出力サイズ = figsize × dpi）"""
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=CHART_DPI, facecolor=COLORS['bg'])
+    return buf.getvalue()
+
+
+@st.cache_data(ttl=300)
+def single_chart_png(ticker, period):
+    """単一銘柄チャートの PNG（5分キャッシュ）"""
+    data = get_analyzed_data(ticker, period)
+    # Figure はセッション間で共有するため lock 中に描画・ラスタライズ
+    with single_chart_figure()['lock']:
+        return figure_to_png(create_single_chart(data, ticker))
+
+
+@st.cache_data(ttl=300)
+def comparison_chart_png(tickers, period):
+    """比較チャートの PNG（5分キャッシュ）"""
+    all_data = {t: get_analyzed_data(t, period) for t in tickers}
+    fig = create_comparison_chart(all_data, list(tickers))
+    png = figure_to_png(fig)
+    plt.close(fig)
+    return png
+
+
 # ═══════════════════════════════════════════════════════════
 #  サイドバー
 # ═══════════════════════════════════════════════════════════
@@ -343,7 +757,7 @@ if analyze_btn:
 
         with st.spinner(f"⏳ {ticker} のデータを取得中..."):
             try:
-                data = fetch_stock_data(ticker, selected_period)
+                data = get_analyzed_data(ticker, selected_period)
             except Exception as e:
                 st.error(f"❌ データ取得エラー: {e}")
                 st.stop()
@@ -352,32 +766,21 @@ if analyze_btn:
             st.error(f"❌ {ticker} のデータが見つかりません")
             st.stop()
 
-        data = calculate_indicators(data)
-
         # 分析データ
-        latest = data['Close'].iloc[-1]
-        prev = data['Close'].iloc[-2] if len(data) > 1 else latest
-        change = latest - prev
-        change_pct = (change / prev) * 100
-        period_return = ((latest / data['Close'].iloc[0]) - 1) * 100
-        rsi = data['RSI'].iloc[-1] if not pd.isna(data['RSI'].iloc[-1]) else 0
-        macd_val = data['MACD'].iloc[-1] if not pd.isna(data['MACD'].iloc[-1]) else 0
-        signal_val = data['Signal'].iloc[-1] if not pd.isna(data['Signal'].iloc[-1]) else 0
+        stats = summary_stats(ticker, selected_period)
+        latest = stats['latest']
+        change = stats['change']
+        change_pct = stats['change_pct']
+        period_return = stats['period_return']
+        rsi = 0 if math.isnan(stats['rsi']) else stats['rsi']
+        macd_val = 0 if math.isnan(stats['macd']) else stats['macd']
+        signal_val = 0 if math.isnan(stats['signal']) else stats['signal']
 
         # トレンド判定
-        sma10 = data['SMA_10'].iloc[-1]
-        sma30 = data['SMA_30'].iloc[-1]
-        if not pd.isna(sma10) and not pd.isna(sma30):
-            if latest > sma10 > sma30:
-                trend_text, trend_class = "📈 強い上昇トレンド", "trend-bullish"
-            elif latest > sma10:
-                trend_text, trend_class = "📊 上昇トレンド", "trend-bullish"
-            elif latest < sma10 < sma30:
-                trend_text, trend_class = "📉 強い下降トレンド", "trend-bearish"
-            elif latest < sma10:
-                trend_text, trend_class = "📉 下降トレンド", "trend-bearish"
-            else:
-                trend_text, trend_class = "➡️ 横ばい", "trend-neutral"
+        sma10 = stats['sma10']
+        sma30 = stats['sma30']
+        if not math.isnan(sma10) and not math.isnan(sma30):
+            trend_text, trend_class = TRENDS[trend_code(latest, sma10, sma30)]
         else:
             trend_text, trend_class = "📊 データ不足", "trend-neutral"
 
@@ -386,27 +789,23 @@ if analyze_btn:
         delta_cls = "metric-delta-up" if change >= 0 else "metric-delta-down"
         delta_sym = "▲" if change >= 0 else "▼"
 
-        cols = st.columns(5)
         metrics = [
             ("最新価格", f"${latest:.2f}", f"{delta_sym} {abs(change):.2f} ({change_pct:+.2f}%)"),
             ("期間リターン", f"{period_return:+.2f}%", None),
             ("RSI", f"{rsi:.1f}", "買われすぎ" if rsi > 70 else ("売られすぎ" if rsi < 30 else "中立")),
             ("MACD", f"{macd_val:.4f}", "買い" if macd_val > signal_val else "売り"),
-            ("出来高 (平均)", f"{data['Volume'].mean()/1e6:.1f}M", None),
+            ("出来高 (平均)", f"{stats['vol_mean']/1e6:.1f}M", None),
         ]
 
-        for i, (label, value, delta) in enumerate(metrics):
-            with cols[i]:
-                delta_html = ""
-                if delta:
-                    delta_html = f'<div class="{delta_cls}">{delta}</div>'
-                st.markdown(f"""
-                <div class="metric-card">
-                    <div class="metric-label">{label}</div>
-                    <div class="metric-value">{value}</div>
-                    {delta_html}
-                </div>
-                """, unsafe_allow_html=True)
+        # 5枚のカードは CSS グリッドでまとめ、1回の st.markdown で送る
+        cards = []
+        for label, value, delta in metrics:
+            delta_html = f'<div class="{delta_cls}">{delta}</div>' if delta else ""
+            cards.append(
+                f'<div class="metric-card"><div class="metric-label">{label}</div>'
+                f'<div class="metric-value">{value}</div>{delta_html}</div>'
+            )
+        st.markdown(f'<div class="metric-grid">{"".join(cards)}</div>', unsafe_allow_html=True)
 
         st.markdown("")
 
@@ -416,19 +815,21 @@ if analyze_btn:
         st.markdown("")
 
         # チャート
-        fig = create_single_chart(data, ticker)
-        st.pyplot(fig, use_container_width=True)
-        plt.close(fig)
+        st.image(single_chart_png(ticker, selected_period), width=CHART_DISPLAY_WIDTH)
 
         # データテーブル
         with st.expander("📋 直近のデータを表示"):
             display_cols = ['Open', 'High', 'Low', 'Close', 'Volume', 'SMA_10', 'SMA_30', 'RSI', 'MACD']
             available = [c for c in display_cols if c in data.columns]
-            st.dataframe(data[available].tail(20).style.format({
-                'Open': '${:.2f}', 'High': '${:.2f}', 'Low': '${:.2f}', 'Close': '${:.2f}',
-                'Volume': '{:,.0f}', 'SMA_10': '${:.2f}', 'SMA_30': '${:.2f}',
-                'RSI': '{:.2f}', 'MACD': '{:.4f}'
-            }), use_container_width=True)
+            # 書式はブラウザ側で適用（Styler の要素ごとの Python 書式化を避ける）
+            price_col = st.column_config.NumberColumn(format='$%.2f')
+            st.dataframe(data[available].tail(20), column_config={
+                'Open': price_col, 'High': price_col, 'Low': price_col, 'Close': price_col,
+                'Volume': st.column_config.NumberColumn(format='localized'),
+                'SMA_10': price_col, 'SMA_30': price_col,
+                'RSI': st.column_config.NumberColumn(format='%.2f'),
+                'MACD': st.column_config.NumberColumn(format='%.4f'),
+            }, use_container_width=True)
 
     else:
         # ─── 複数銘柄比較 ─────────────────────────────────
@@ -436,20 +837,21 @@ if analyze_btn:
             st.warning("⚠️ 比較には2銘柄以上を入力してください（カンマ区切り）")
             st.stop()
 
-        all_data = {}
-        progress = st.progress(0, text="データを取得中...")
+        # 通信待ちを重ねるため並列取得（Streamlit の呼び出しはメインスレッドのみ）
+        with st.spinner(f"⏳ {', '.join(tickers)} のデータを取得中..."):
+            with ThreadPoolExecutor(max_workers=min(8, len(tickers))) as executor:
+                futures = {ticker: executor.submit(get_analyzed_data, ticker, selected_period)
+                           for ticker in tickers}
 
-        for i, ticker in enumerate(tickers):
-            progress.progress((i + 1) / len(tickers), text=f"⏳ {ticker} を取得中...")
+        all_data = {}
+        for ticker, future in futures.items():
             try:
-                d = fetch_stock_data(ticker, selected_period)
+                d = future.result()
                 if not d.empty:
                     all_data[ticker] = d
             except Exception:
                 st.warning(f"⚠️ {ticker} のデータ取得に失敗")
 
-        progress.empty()
-
         if len(all_data) < 2:
             st.error("❌ 比較できる銘柄が不足しています")
             st.stop()
@@ -473,9 +875,7 @@ if analyze_btn:
         st.markdown("")
 
         # 比較チャート
-        fig = create_comparison_chart(all_data, tickers)
-        st.pyplot(fig, use_container_width=True)
-        plt.close(fig)
+        st.image(comparison_chart_png(tuple(all_data), selected_period), width=CHART_DISPLAY_WIDTH)
 
 else:
     # ─── ウェルカムスクリーン ──────────────────────────────
@@ -19,7 +19,17 @@ Yahoo Financeの公開データを使用して、株価のテクニカル分析
 - 読み取り専用Webアクセス（会員登録・送信なし）
 - ローカルフォルダのみ使用
 - 実際の売買は行わず分析のみ
-- time.sleep(3) でAPI制限を遵守
+- Yahoo Finance へのリクエストは3秒以上の間隔を空けてAPI制限を遵守
+
+性能メモ（処理ごとのボトルネック）:
+- データ取得: ネットワーク律速。複数銘柄は yf.download で一括取得し、
+  当日分は output/.cache/ の pickle を再利用する。待機はリクエスト直前のみ
+- 指標計算: メモリ帯域律速。数 kB の配列を数回なめるだけなので、
+  走査回数の削減（共通配列の使い回し）が効く。表示桁を保つため float64 のまま計算する
+- RSI・EMA・日次リターン: Python/pandas 呼び出し律速。NumPy・numba の
+  カーネルで処理し、比較分析でも銘柄ごとに一度だけ計算する
+- 描画: レイテンシ律速。rcParams で一括設定し、複数系列は LineCollection で描く
+- SIMD や GPU など演算側の最適化は、データが L1 に収まる規模のため効果がない
 """
 
 import time
@@ -33,8 +43,13 @@ import argparse
 try:
     import yfinance as yf
     import pandas as pd
+    import matplotlib
+    matplotlib.use('Agg')  # 画像保存のみなので GUI バックエンドは不要
     import matplotlib.pyplot as plt
     import matplotlib.dates as mdates
+    from matplotlib.patches import Patch
+    from matplotlib.collections import LineCollection
+    from matplotlib.lines import Line2D
     from matplotlib.style import use
     import numpy as np
 except ImportError as e:
@@ -50,9 +65,44 @@ try:
 except ImportError:
     HAS_MPLFINANCE = False
 
+# bottleneck はオプション（移動平均・移動標準偏差の高速化用）
+try:
+    import bottleneck as bn
+    HAS_BOTTLENECK = True
+except ImportError:
+    HAS_BOTTLENECK = False
+
+# scipy はオプション（numba が無い場合の EWM 計算用）
+try:
+    from scipy.signal import lfilter, lfiltic
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+# numba はオプション（EWM 計算の高速化用）
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        """numba 未導入時は関数をそのまま返す"""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# JIT オプション: cache でコンパイル結果を __pycache__ に保存し2回目以降の起動を速くする。
+# fastmath は NaN 判定を壊さないフラグ（nnan/ninf 以外）のみ、加算順序も変えない（reassoc なし）
+JIT_OPTIONS = dict(cache=True, boundscheck=False, fastmath={'nsz', 'arcp', 'contract', 'afn'})
+
 # ─── 定数 ─────────────────────────────────────────────────
-VALID_PERIODS = ['1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max']
+PERIOD_CHOICES = ('1d', '5d', '1mo', '3mo', '6mo', '1y', '2y', '5y', '10y', 'ytd', 'max')  # 表示順
+VALID_PERIODS = frozenset(PERIOD_CHOICES)
 OUTPUT_DIR = Path('./output')
+API_INTERVAL = 3  # Yahoo Finance へのリクエスト間隔（秒）
+CACHE_DIR = OUTPUT_DIR / '.cache'
+SHORT_PERIODS = ('1d', '5d')  # 場中に更新される期間はキャッシュしない
 
 # ─── カラーパレット ─────────────────────────────────────────
 COLORS = {
@@ -77,9 +127,25 @@ COLORS = {
     'oversold':   '#6bcb77',
 }
 
-# ─── 日本語フォント設定 ────────────────────────────────────
-plt.rcParams['font.sans-serif'] = ['Meiryo', 'Yu Gothic', 'MS Gothic', 'Segoe UI Symbol', 'SimHei', 'Arial Unicode MS']
-plt.rcParams['axes.unicode_minus'] = False
+# ─── ダークテーマ（全 Axes の既定スタイル）＋日本語フォント設定 ──────
+DARK_THEME = {
+    'figure.facecolor': COLORS['bg'],
+    'axes.facecolor': COLORS['panel'],
+    'axes.edgecolor': COLORS['grid'],
+    'axes.spines.top': False,
+    'axes.spines.right': False,
+    'axes.grid': True,
+    'grid.color': COLORS['grid'],
+    'grid.alpha': 0.15,
+    'grid.linestyle': '--',
+    'xtick.color': COLORS['text'],
+    'ytick.color': COLORS['text'],
+    'xtick.labelsize': 9,
+    'ytick.labelsize': 9,
+    'font.sans-serif': ['Meiryo', 'Yu Gothic', 'MS Gothic', 'Segoe UI Symbol', 'SimHei', 'Arial Unicode MS'],
+    'axes.unicode_minus': False,
+}
+plt.rcParams.update(DARK_THEME)
 
 
 def ensure_output_dir():
@@ -87,6 +153,145 @@ def ensure_output_dir():
     OUTPUT_DIR.mkdir(exist_ok=True)
 
 
+def set_date_format(axes, fmt='%m/%d'):
+    """x 軸の日付書式をまとめて設定（Formatter は軸ごとに別インスタンス）"""
+    for ax in axes:
+        ax.xaxis.set_major_formatter(mdates.DateFormatter(fmt))
+
+
+def plot_line_collection(ax, series, colors, linewidth, alpha=1.0):
+    """銘柄ごとの (x, y) 系列を1つの LineCollection で描画し、凡例を付ける"""
+    line_colors = [colors[i % len(colors)] for i in range(len(series))]
+    segments = [np.column_stack([x, y]) for x, y in series.values()]
+    ax.add_collection(LineCollection(segments, colors=line_colors, linewidths=linewidth, alpha=alpha))
+    ax.xaxis_date()
+    ax.autoscale_view()
+    handles = [Line2D([], [], color=c, linewidth=linewidth, alpha=alpha, label=ticker)
+               for ticker, c in zip(series, line_colors)]
+    ax.legend(handles=handles, facecolor=COLORS['panel'], edgecolor=COLORS['grid'],
+              labelcolor=COLORS['text'])
+
+
+_last_api_call = None
+
+
+def wait_for_api():
+    """API制限対応: 前回のリクエストから API_INTERVAL 秒経つまで待つ（初回は API_INTERVAL 秒待つ）"""
+    global _last_api_call
+    if _last_api_call is None:
+        wait = API_INTERVAL
+    else:
+        wait = API_INTERVAL - (time.monotonic() - _last_api_call)
+    if wait > 0:
+        time.sleep(wait)
+    _last_api_call = time.monotonic()
+
+
+def _rolling_mean(values, window):
+    """単純移動平均（先頭の window-1 件は NaN、pandas の rolling().mean() と同じ形）"""
+    out = np.full(len(values), np.nan)
+    if len(values) < window:
+        return out
+    if HAS_BOTTLENECK:
+        # bottleneck は入力の dtype で累積和を持つため、誤差が溜まらないよう float64 で渡す
+        return bn.move_mean(values.astype(np.float64, copy=False), window=window, min_count=window)
+    out[window - 1:] = np.lib.stride_tricks.sliding_window_view(values, window).mean(axis=1)
+    return out
+
+
+def _rolling_std(values, window):
+    """移動標準偏差（不偏, ddof=1）"""
+    out = np.full(len(values), np.nan)
+    if len(values) < window:
+        return out
+    if HAS_BOTTLENECK:
+        return bn.move_std(values.astype(np.float64, copy=False), window=window, min_count=window, ddof=1)
+    out[window - 1:] = np.lib.stride_tricks.sliding_window_view(values, window).std(axis=1, ddof=1)
+    return out
+
+
+@njit(**JIT_OPTIONS)
+def _ewm_alpha_kernel(values, alpha):
+    """adjust=False の指数移動平均（NaN の扱いは pandas と同じ）"""
+    out = np.empty(values.shape[0])
+    weighted = np.nan
+    old_wt = 1.0
+    for i in range(values.shape[0]):
+        cur = values[i]
+        if np.isnan(weighted):
+            weighted = cur
+            old_wt = 1.0
+        else:
+            old_wt *= 1.0 - alpha
+            if not np.isnan(cur):
+                weighted = (old_wt * weighted + alpha * cur) / (old_wt + alpha)
+                old_wt = 1.0
+        out[i] = weighted
+    return out
+
+
+@njit(**JIT_OPTIONS)
+def _rsi_kernel(close, period):
+    """終値を1回走査して RSI を計算（上昇幅・下落幅の単純移動平均を差分更新）"""
+    n = close.shape[0]
+    out = np.full(n, np.nan)
+    gains = np.zeros(n)
+    losses = np.zeros(n)
+    gain_sum = 0.0
+    loss_sum = 0.0
+    # ウィンドウ内の非ゼロ要素数（0 件なら合計を厳密に 0 とみなす）
+    gain_cnt = 0
+    loss_cnt = 0
+    for i in range(1, n):
+        d = close[i] - close[i - 1]
+        if d > 0:
+            gains[i] = d
+        elif d < 0:
+            losses[i] = -d
+    for i in range(n):
+        gain_sum += gains[i]
+        loss_sum += losses[i]
+        gain_cnt += gains[i] > 0
+        loss_cnt += losses[i] > 0
+        if i >= period:
+            gain_sum -= gains[i - period]
+            loss_sum -= losses[i - period]
+            gain_cnt -= gains[i - period] > 0
+            loss_cnt -= losses[i - period] > 0
+        if i >= period - 1:
+            g = gain_sum / period if gain_cnt > 0 else 0.0
+            lo = loss_sum / period if loss_cnt > 0 else 0.0
+            if lo > 0:
+                out[i] = 100.0 - 100.0 / (1.0 + g / lo)
+            elif g > 0:
+                out[i] = 100.0
+    return out
+
+
+def _rsi(close, period=14):
+    """RSI（上昇幅・下落幅の単純移動平均による定義）"""
+    if HAS_NUMBA:
+        return _rsi_kernel(close, period)
+    delta = np.diff(close, prepend=np.nan)
+    gain = _rolling_mean(np.where(delta > 0, delta, 0.0), period)
+    loss = _rolling_mean(np.where(delta < 0, -delta, 0.0), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - (100 / (1 + gain / loss))
+
+
+def _ewm_alpha(values, span):
+    """span 指定の EWM（numba → scipy → pandas の順に利用可能なものを使う）"""
+    alpha = 2.0 / (span + 1.0)
+    if HAS_NUMBA:
+        return _ewm_alpha_kernel(values, alpha)
+    if HAS_SCIPY and len(values) and not np.isnan(values).any():
+        # y[i] = α·x[i] + (1-α)·y[i-1] の1次 IIR。初期状態を x[0] にして adjust=False と一致させる
+        b, a = [alpha], [1.0, alpha - 1.0]
+        y, _ = lfilter(b, a, values, zi=lfiltic(b, a, [values[0]]))
+        return y
+    return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+
+
 class StockAnalyzer:
     """株価テクニカル分析クラス"""
 
@@ -106,7 +311,7 @@ class StockAnalyzer:
         # 期間バリデーション
         if self.period not in VALID_PERIODS:
             print(f"⚠️  無効な期間: '{self.period}'")
-            print(f"   有効な値: {', '.join(VALID_PERIODS)}")
+            print(f"   有効な値: {', '.join(PERIOD_CHOICES)}")
             suggestion = self._suggest_period(self.period)
             if suggestion:
                 print(f"   → もしかして: '{suggestion}' ?")
@@ -118,13 +323,41 @@ class StockAnalyzer:
         mapping = {'1m': '1mo', '3m': '3mo', '6m': '6mo'}
         return mapping.get(invalid)
 
+    @classmethod
+    def from_dataframe(cls, ticker, data, period='1mo'):
+        """取得済みの DataFrame から生成（fetch_data を省略）"""
+        analyzer = cls(ticker, period)
+        analyzer.data = data
+        return analyzer
+
     def fetch_data(self):
         """Yahoo Financeから株価データを取得"""
         print(f"  ⏳ {self.ticker} のデータを取得中...")
 
         try:
-            stock = yf.Ticker(self.ticker)
-            self.data = stock.history(period=self.period)
+            # 同じ日の同じ銘柄・期間はローカルキャッシュから読み込む（短期間は除く）
+            use_cache = self.period not in SHORT_PERIODS
+            cache_file = CACHE_DIR / f'{self.ticker}_{self.period}_{datetime.now().strftime("%Y%m%d")}.pkl'
+            self.data = None
+            if use_cache and cache_file.exists():
+                try:
+                    self.data = pd.read_pickle(cache_file)
+                except Exception:
+                    self.data = None  # 壊れたキャッシュは使わず取得し直す
+            if self.data is None:
+                wait_for_api()
+                stock = yf.Ticker(self.ticker)
+                self.data = stock.history(period=self.period)
+                if use_cache and not self.data.empty:
+                    # 一時ファイルに書いてから置き換え、書き込み途中のファイルを残さない
+                    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+                    tmp_file = cache_file.with_name(f'{cache_file.name}.{os.getpid()}.tmp')
+                    self.data.to_pickle(tmp_file)
+                    os.replace(tmp_file, cache_file)
+                    # 同じ銘柄・期間の前日までのキャッシュは不要なので削除
+                    for old_file in CACHE_DIR.glob(f'{self.ticker}_{self.period}_{"[0-9]" * 8}.pkl'):
+                        if old_file != cache_file:
+                            old_file.unlink(missing_ok=True)
 
             if self.data.empty:
                 print(f"  ❌ {self.ticker} のデータが見つかりません")
@@ -142,49 +375,56 @@ class StockAnalyzer:
     def calculate_technical_indicators(self):
         """テクニカル指標を計算"""
 
+        # 終値の配列を一度だけ取り出し、以降は NumPy 上で計算
+        # 高額銘柄でもレポートの桁が狂わないよう指標は float64 で計算する
+        close = self.data['Close'].to_numpy(dtype=np.float64)
+
         # 1. 移動平均線
-        self.data['SMA_10'] = self.data['Close'].rolling(window=10).mean()
-        self.data['SMA_30'] = self.data['Close'].rolling(window=30).mean()
-        self.data['SMA_60'] = self.data['Close'].rolling(window=60).mean()
+        sma_10 = _rolling_mean(close, 10)
+        sma_30 = _rolling_mean(close, 30)
+        sma_60 = _rolling_mean(close, 60)
 
-        # 2. ボラティリティ（標準偏差）
-        self.data['Volatility'] = self.data['Close'].rolling(window=20).std()
+        # 2. ボラティリティ（標準偏差、ボリンジャーバンドと共用）
+        bb_period = 20
+        bb_std = 2
+        std_20 = _rolling_std(close, bb_period)
 
         # 3. RSI (Relative Strength Index)
-        delta = self.data['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        self.data['RSI'] = 100 - (100 / (1 + rs))
+        rsi = _rsi(close)
 
         # 4. MACD
-        exp1 = self.data['Close'].ewm(span=12, adjust=False).mean()
-        exp2 = self.data['Close'].ewm(span=26, adjust=False).mean()
-        self.data['MACD'] = exp1 - exp2
-        self.data['Signal'] = self.data['MACD'].ewm(span=9, adjust=False).mean()
-        self.data['Histogram'] = self.data['MACD'] - self.data['Signal']
+        macd = _ewm_alpha(close, 12) - _ewm_alpha(close, 26)
+        signal = _ewm_alpha(macd, 9)
 
         # 5. ボリンジャーバンド
-        bb_period = 20
-        bb_std = 2
-        self.data['BB_Middle'] = self.data['Close'].rolling(window=bb_period).mean()
-        bb_std_dev = self.data['Close'].rolling(window=bb_period).std()
-        self.data['BB_Upper'] = self.data['BB_Middle'] + (bb_std_dev * bb_std)
-        self.data['BB_Lower'] = self.data['BB_Middle'] - (bb_std_dev * bb_std)
+        bb_middle = _rolling_mean(close, bb_period)
+
+        self.data['SMA_10'] = sma_10
+        self.data['SMA_30'] = sma_30
+        self.data['SMA_60'] = sma_60
+        self.data['Volatility'] = std_20
+        self.data['RSI'] = rsi
+        self.data['MACD'] = macd
+        self.data['Signal'] = signal
+        self.data['Histogram'] = macd - signal
+        self.data['BB_Middle'] = bb_middle
+        self.data['BB_Upper'] = bb_middle + (std_20 * bb_std)
+        self.data['BB_Lower'] = bb_middle - (std_20 * bb_std)
 
         # 6. 日次リターン
-        self.data['Daily_Return'] = self.data['Close'].pct_change() * 100
+        daily_return = np.empty_like(close)
+        daily_return[0] = np.nan
+        daily_return[1:] = (close[1:] / close[:-1] - 1.0) * 100.0
+        self.data['Daily_Return'] = daily_return
 
         print(f"  ✅ テクニカル指標計算完了")
 
     def analyze_trend(self):
         """トレンド分析"""
-        latest_price = self.data['Close'].iloc[-1]
-        sma_10 = self.data['SMA_10'].iloc[-1]
-        sma_30 = self.data['SMA_30'].iloc[-1]
-        rsi = self.data['RSI'].iloc[-1]
-        macd = self.data['MACD'].iloc[-1]
-        signal = self.data['Signal'].iloc[-1]
+        # 必要な列を一度だけ NumPy 配列として取り出す
+        arr = self.data[['Close', 'SMA_10', 'SMA_30', 'RSI', 'MACD', 'Signal',
+                         'Volatility', 'High', 'Low', 'Volume']].to_numpy(dtype=np.float64)
+        latest_price, sma_10, sma_30, rsi, macd, signal, volatility = arr[-1, :7]
 
         # トレンド判定
         if latest_price > sma_10 > sma_30:
@@ -223,7 +463,7 @@ class StockAnalyzer:
             macd_signal = "売りシグナル (Bearish)"
 
         # 価格変動率
-        period_return = ((latest_price / self.data['Close'].iloc[0]) - 1) * 100
+        period_return = ((latest_price / arr[0, 0]) - 1) * 100
 
         return {
             'trend': trend,
@@ -238,10 +478,10 @@ class StockAnalyzer:
             'signal': signal,
             'macd_signal': macd_signal,
             'period_return': period_return,
-            'volatility': self.data['Volatility'].iloc[-1],
-            'high': self.data['High'].max(),
-            'low': self.data['Low'].min(),
-            'avg_volume': self.data['Volume'].mean(),
+            'volatility': volatility,
+            'high': np.nanmax(arr[:, 7]),
+            'low': np.nanmin(arr[:, 8]),
+            'avg_volume': np.nanmean(arr[:, 9]),
         }
 
     def plot_chart(self):
@@ -250,16 +490,6 @@ class StockAnalyzer:
 
         fig, axes = plt.subplots(4, 1, figsize=(14, 16),
                                  gridspec_kw={'height_ratios': [3, 1, 1.5, 1.5]})
-        fig.patch.set_facecolor(COLORS['bg'])
-
-        for ax in axes:
-            ax.set_facecolor(COLORS['panel'])
-            ax.tick_params(colors=COLORS['text'], labelsize=9)
-            ax.spines['top'].set_visible(False)
-            ax.spines['right'].set_visible(False)
-            ax.spines['bottom'].set_color(COLORS['grid'])
-            ax.spines['left'].set_color(COLORS['grid'])
-            ax.grid(True, alpha=0.15, color=COLORS['grid'], linestyle='--')
 
         analysis = self.analyze_trend()
 
@@ -293,20 +523,16 @@ class StockAnalyzer:
                        fontweight='bold', color=COLORS['text'], pad=10)
         ax1.legend(loc='upper left', fontsize=8, facecolor=COLORS['panel'],
                    edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
-        ax1.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
-        plt.setp(ax1.xaxis.get_majorticklabels(), rotation=0)
 
         # ─── グラフ2: 出来高 ────────────────────────────
         ax2 = axes[1]
-        colors_vol = [COLORS['vol_up'] if self.data['Close'].iloc[i] >= self.data['Open'].iloc[i]
-                      else COLORS['vol_down'] for i in range(len(self.data))]
+        colors_vol = np.where(self.data['Close'].to_numpy() >= self.data['Open'].to_numpy(),
+                              COLORS['vol_up'], COLORS['vol_down'])
         ax2.bar(self.data.index, self.data['Volume'], color=colors_vol, alpha=0.7, width=0.8)
         ax2.set_ylabel('出来高', fontsize=10, color=COLORS['text'])
         ax2.set_title('出来高 (Volume)', fontsize=12, fontweight='bold',
                        color=COLORS['text'], pad=10)
         ax2.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{x/1e6:.0f}M'))
-        ax2.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
-        plt.setp(ax2.xaxis.get_majorticklabels(), rotation=0)
 
         # ─── グラフ3: RSI ────────────────────────────────
         ax3 = axes[2]
@@ -324,8 +550,6 @@ class StockAnalyzer:
         ax3.set_ylim([0, 100])
         ax3.legend(loc='upper left', fontsize=8, facecolor=COLORS['panel'],
                    edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
-        ax3.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
-        plt.setp(ax3.xaxis.get_majorticklabels(), rotation=0)
 
         # ─── グラフ4: MACD ───────────────────────────────
         ax4 = axes[3]
@@ -334,27 +558,28 @@ class StockAnalyzer:
         ax4.plot(self.data.index, self.data['Signal'],
                  label='Signal', color=COLORS['signal'], linewidth=1.5)
 
-        # ヒストグラム（正負で色分け）
-        hist = self.data['Histogram']
-        ax4.bar(self.data.index, hist.where(hist >= 0), color=COLORS['hist_pos'],
-                alpha=0.5, width=0.8, label='Histogram (+)')
-        ax4.bar(self.data.index, hist.where(hist < 0), color=COLORS['hist_neg'],
-                alpha=0.5, width=0.8, label='Histogram (-)')
+        # ヒストグラム（正負で色分けし、1回の bar で描画）
+        hist = self.data['Histogram'].to_numpy()
+        hist_colors = np.where(hist >= 0, COLORS['hist_pos'], COLORS['hist_neg'])
+        ax4.bar(self.data.index, hist, color=hist_colors, alpha=0.5, width=0.8)
+        # 凡例の正負エントリは見本の Patch で表示
+        handles, _ = ax4.get_legend_handles_labels()
+        handles += [Patch(facecolor=COLORS['hist_pos'], alpha=0.5, label='Histogram (+)'),
+                    Patch(facecolor=COLORS['hist_neg'], alpha=0.5, label='Histogram (-)')]
 
         ax4.set_ylabel('MACD', fontsize=10, color=COLORS['text'])
         ax4.set_title('MACD', fontsize=12, fontweight='bold',
                        color=COLORS['text'], pad=10)
-        ax4.legend(loc='upper left', fontsize=8, facecolor=COLORS['panel'],
+        ax4.legend(handles=handles, loc='upper left', fontsize=8, facecolor=COLORS['panel'],
                    edgecolor=COLORS['grid'], labelcolor=COLORS['text'])
-        ax4.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
-        plt.setp(ax4.xaxis.get_majorticklabels(), rotation=0)
 
+        set_date_format(axes)
         plt.tight_layout(rect=[0, 0, 1, 0.95])
 
         # 保存
         ensure_output_dir()
         filename = OUTPUT_DIR / f'{self.ticker}_analysis_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png'
-        plt.savefig(filename, dpi=150, bbox_inches='tight', facecolor=COLORS['bg'])
+        plt.savefig(filename, dpi=150, bbox_inches=None, facecolor=COLORS['bg'])
         print(f"  💾 チャート保存: {filename}")
         plt.close()
 
@@ -362,69 +587,73 @@ class StockAnalyzer:
 
     def generate_report(self):
         """分析レポートを生成"""
-        analysis = self.analyze_trend()
-
-        report = f"""
-{'═' * 60}
-  {analysis['trend_emoji']} {self.ticker} 株価テクニカル分析レポート
-{'═' * 60}
-
-  📊 基本情報
-  {'─' * 40}
-  ティッカー     : {self.ticker}
-  分析期間       : {self.period}
-  最新終値       : ${analysis['latest_price']:.2f}
-  期間最高値     : ${analysis['high']:.2f}
-  期間最安値     : ${analysis['low']:.2f}
-  期間リターン   : {analysis['period_return']:+.2f}%
-  平均出来高     : {analysis['avg_volume']:,.0f}
-
-  📈 移動平均線
-  {'─' * 40}
-  SMA 10日       : ${analysis['sma_10']:.2f}
-  SMA 30日       : ${analysis['sma_30']:.2f}
-  ボラティリティ : {analysis['volatility']:.2f}
-
-  🔍 トレンド分析
-  {'─' * 40}
-  {analysis['trend']}
-
-  🎯 RSI指標
-  {'─' * 40}
-  RSI値          : {analysis['rsi']:.2f}
-  シグナル       : {analysis['rsi_signal']}
-
-  📉 MACD
-  {'─' * 40}
-  MACD           : {analysis['macd']:.4f}
-  シグナル線     : {analysis['signal']:.4f}
-  判定           : {analysis['macd_signal']}
-
-  📋 テクニカル指標の要約
-  {'─' * 40}
-  • SMA   : 短期(10)が長期(30)の上 → 上昇トレンド
-  • RSI   : 70超=買われすぎ / 30未満=売られすぎ
-  • MACD  : MACDがシグナル線を上抜け → 買いシグナル
-
-  ⚠️  免責事項
-  {'─' * 40}
-  この分析は教育目的であり、投資助言ではありません。
-  実際の投資決定は自己責任で行ってください。
-  過去のパフォーマンスが将来の結果を保証するものではありません。
-
-{'═' * 60}
-  生成日時: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-{'═' * 60}
-"""
-
-        # レポートを保存
+        a = self.analyze_trend()
+        rule = '═' * 60
+        section = '─' * 40
+
+        lines = [
+            '',
+            rule,
+            f"  {a['trend_emoji']} {self.ticker} 株価テクニカル分析レポート",
+            rule,
+            '',
+            '  📊 基本情報',
+            f'  {section}',
+            f'  ティッカー     : {self.ticker}',
+            f'  分析期間       : {self.period}',
+            f"  最新終値       : ${a['latest_price']:.2f}",
+            f"  期間最高値     : ${a['high']:.2f}",
+            f"  期間最安値     : ${a['low']:.2f}",
+            f"  期間リターン   : {a['period_return']:+.2f}%",
+            f"  平均出来高     : {a['avg_volume']:,.0f}",
+            '',
+            '  📈 移動平均線',
+            f'  {section}',
+            f"  SMA 10日       : ${a['sma_10']:.2f}",
+            f"  SMA 30日       : ${a['sma_30']:.2f}",
+            f"  ボラティリティ : {a['volatility']:.2f}",
+            '',
+            '  🔍 トレンド分析',
+            f'  {section}',
+            f"  {a['trend']}",
+            '',
+            '  🎯 RSI指標',
+            f'  {section}',
+            f"  RSI値          : {a['rsi']:.2f}",
+            f"  シグナル       : {a['rsi_signal']}",
+            '',
+            '  📉 MACD',
+            f'  {section}',
+            f"  MACD           : {a['macd']:.4f}",
+            f"  シグナル線     : {a['signal']:.4f}",
+            f"  判定           : {a['macd_signal']}",
+            '',
+            '  📋 テクニカル指標の要約',
+            f'  {section}',
+            '  • SMA   : 短期(10)が長期(30)の上 → 上昇トレンド',
+            '  • RSI   : 70超=買われすぎ / 30未満=売られすぎ',
+            '  • MACD  : MACDがシグナル線を上抜け → 買いシグナル',
+            '',
+            '  ⚠️  免責事項',
+            f'  {section}',
+            '  この分析は教育目的であり、投資助言ではありません。',
+            '  実際の投資決定は自己責任で行ってください。',
+            '  過去のパフォーマンスが将来の結果を保証するものではありません。',
+            '',
+            rule,
+            f"  生成日時: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+            rule,
+            '',
+        ]
+        report = '\n'.join(lines)
+
+        # レポートを保存（1回の書き込み）
         ensure_output_dir()
         filename = OUTPUT_DIR / f'{self.ticker}_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.txt'
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(report)
+        filename.write_text(report, encoding='utf-8')
 
         print(f"  📝 レポート保存: {filename}")
-        print(report)
+        sys.stdout.write(report + '\n')
 
         return str(filename)
 
@@ -435,22 +664,13 @@ class StockAnalyzer:
         print(f"  📅 期間: {self.period}")
         print(f"{'━' * 60}\n")
 
-        # API制限対応: タイムアウト設定
-        time.sleep(3)
-
         # データ取得
         if not self.fetch_data():
             return False
 
-        # API制限対応
-        time.sleep(2)
-
         # テクニカル指標計算
         self.calculate_technical_indicators()
 
-        # API制限対応
-        time.sleep(2)
-
         # グラフ生成
         chart_file = self.plot_chart()
 
@@ -475,27 +695,47 @@ def compare_stocks(tickers, period='1mo'):
 
     all_data = {}
 
+    # 全銘柄を1回のリクエストでまとめて取得
+    print(f"  ⏳ {', '.join(tickers)} のデータを取得中...")
+    wait_for_api()
+    try:
+        raw = yf.download(tickers=tickers, period=period, group_by='ticker',
+                          auto_adjust=True, threads=True, progress=False)
+    except Exception as e:
+        print(f"  ❌ データ取得エラー: {e}")
+        return False
+
+    available = set(raw.columns.get_level_values(0)) if not raw.empty else set()
     for ticker in tickers:
-        print(f"  ⏳ {ticker} のデータを取得中...")
-        time.sleep(3)
-        try:
-            stock = yf.Ticker(ticker)
-            data = stock.history(period=period)
-            if not data.empty:
-                all_data[ticker] = data
-                print(f"  ✅ {ticker}: {len(data)}件取得")
-            else:
-                print(f"  ❌ {ticker}: データなし")
-        except Exception as e:
-            print(f"  ❌ {ticker}: エラー - {e}")
+        data = raw[ticker].dropna() if ticker in available else pd.DataFrame()
+        if not data.empty:
+            all_data[ticker] = data
+            print(f"  ✅ {ticker}: {len(data)}件取得")
+        else:
+            print(f"  ❌ {ticker}: データなし")
 
     if len(all_data) < 2:
         print("  ❌ 比較には2銘柄以上のデータが必要です")
         return False
 
+    # 指標は単一銘柄分析と同じ処理で銘柄ごとに一度だけ計算し、チャートとサマリーで共用
+    # 正規化価格と累積リターンも終値配列から一度だけ求め、日付の数値化とあわせて (x, y) で保持
+    norm, rsi, ret, cum = {}, {}, {}, {}
+    for ticker, data in all_data.items():
+        analyzer = StockAnalyzer.from_dataframe(ticker, data, period)
+        analyzer.calculate_technical_indicators()
+        data = analyzer.data
+        all_data[ticker] = data
+        x = mdates.date2num(data.index)
+        close = data['Close'].to_numpy()
+        normalized = close / close[0] * 100.0
+        norm[ticker] = (x, normalized)
+        rsi[ticker] = (x, data['RSI'].to_numpy())
+        ret[ticker] = (x, data['Daily_Return'].to_numpy())
+        cum[ticker] = (x, normalized - 100.0)
+
     # ─── 比較チャート描画 ────────────────────────────────
     fig, axes = plt.subplots(2, 2, figsize=(16, 12))
-    fig.patch.set_facecolor(COLORS['bg'])
     fig.suptitle('複数銘柄比較分析', fontsize=20, fontweight='bold',
                  color=COLORS['text'], y=0.995)
     fig.text(0.5, 0.97, f'{" vs ".join(tickers)}  |  期間: {period}',
@@ -503,38 +743,16 @@ def compare_stocks(tickers, period='1mo'):
 
     chart_colors = ['#00d4ff', '#ff6b6b', '#ffd93d', '#6bcb77', '#c084fc', '#fb923c']
 
-    for ax in axes.flat:
-        ax.set_facecolor(COLORS['panel'])
-        ax.tick_params(colors=COLORS['text'], labelsize=9)
-        ax.spines['top'].set_visible(False)
-        ax.spines['right'].set_visible(False)
-        ax.spines['bottom'].set_color(COLORS['grid'])
-        ax.spines['left'].set_color(COLORS['grid'])
-        ax.grid(True, alpha=0.15, color=COLORS['grid'], linestyle='--')
-
     # (1) 正規化価格比較
     ax1 = axes[0, 0]
-    for i, (ticker, data) in enumerate(all_data.items()):
-        normalized = (data['Close'] / data['Close'].iloc[0]) * 100
-        ax1.plot(data.index, normalized, label=ticker,
-                 color=chart_colors[i % len(chart_colors)], linewidth=2)
+    plot_line_collection(ax1, norm, chart_colors, linewidth=2)
     ax1.set_title('正規化価格 (初日=100)', fontsize=12, fontweight='bold',
                    color=COLORS['text'], pad=10)
     ax1.set_ylabel('正規化価格', color=COLORS['text'])
-    ax1.legend(facecolor=COLORS['panel'], edgecolor=COLORS['grid'],
-               labelcolor=COLORS['text'])
-    ax1.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
     # (2) RSI比較
     ax2 = axes[0, 1]
-    for i, (ticker, data) in enumerate(all_data.items()):
-        delta = data['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
-        ax2.plot(data.index, rsi, label=ticker,
-                 color=chart_colors[i % len(chart_colors)], linewidth=1.5)
+    plot_line_collection(ax2, rsi, chart_colors, linewidth=1.5)
     ax2.axhline(y=70, color=COLORS['overbought'], linestyle='--', alpha=0.5)
     ax2.axhline(y=30, color=COLORS['oversold'], linestyle='--', alpha=0.5)
     ax2.axhspan(70, 100, alpha=0.05, color=COLORS['overbought'])
@@ -543,33 +761,22 @@ def compare_stocks(tickers, period='1mo'):
                    color=COLORS['text'], pad=10)
     ax2.set_ylabel('RSI', color=COLORS['text'])
     ax2.set_ylim([0, 100])
-    ax2.legend(facecolor=COLORS['panel'], edgecolor=COLORS['grid'],
-               labelcolor=COLORS['text'])
-    ax2.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
     # (3) 日次リターン比較
     ax3 = axes[1, 0]
-    for i, (ticker, data) in enumerate(all_data.items()):
-        returns = data['Close'].pct_change() * 100
-        ax3.plot(data.index, returns, label=ticker,
-                 color=chart_colors[i % len(chart_colors)], linewidth=1, alpha=0.8)
+    plot_line_collection(ax3, ret, chart_colors, linewidth=1, alpha=0.8)
     ax3.axhline(y=0, color=COLORS['text'], linestyle='-', alpha=0.3)
     ax3.set_title('日次リターン (%)', fontsize=12, fontweight='bold',
                    color=COLORS['text'], pad=10)
     ax3.set_ylabel('リターン (%)', color=COLORS['text'])
-    ax3.legend(facecolor=COLORS['panel'], edgecolor=COLORS['grid'],
-               labelcolor=COLORS['text'])
-    ax3.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
     # (4) 累積リターン比較
     ax4 = axes[1, 1]
-    for i, (ticker, data) in enumerate(all_data.items()):
-        cumulative = ((data['Close'] / data['Close'].iloc[0]) - 1) * 100
-        ax4.plot(data.index, cumulative, label=ticker,
-                 color=chart_colors[i % len(chart_colors)], linewidth=2)
+    plot_line_collection(ax4, cum, chart_colors, linewidth=2)
+    for i, (ticker, (x, cumulative)) in enumerate(cum.items()):
         # 最終値をアノテーション
-        ax4.annotate(f'{cumulative.iloc[-1]:+.1f}%',
-                     xy=(data.index[-1], cumulative.iloc[-1]),
+        ax4.annotate(f'{cumulative[-1]:+.1f}%',
+                     xy=(x[-1], cumulative[-1]),
                      xytext=(5, 5 + i * 12), textcoords='offset points',
                      fontsize=9, color=chart_colors[i % len(chart_colors)],
                      fontweight='bold')
@@ -577,15 +784,13 @@ def compare_stocks(tickers, period='1mo'):
     ax4.set_title('累積リターン (%)', fontsize=12, fontweight='bold',
                    color=COLORS['text'], pad=10)
     ax4.set_ylabel('累積リターン (%)', color=COLORS['text'])
-    ax4.legend(facecolor=COLORS['panel'], edgecolor=COLORS['grid'],
-               labelcolor=COLORS['text'])
-    ax4.xaxis.set_major_formatter(mdates.DateFormatter('%m/%d'))
 
+    set_date_format(axes.flat)
     plt.tight_layout(rect=[0, 0, 1, 0.95])
 
     ensure_output_dir()
     filename = OUTPUT_DIR / f'compare_{"_".join(tickers)}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.png'
-    plt.savefig(filename, dpi=150, bbox_inches='tight', facecolor=COLORS['bg'])
+    plt.savefig(filename, dpi=150, bbox_inches=None, facecolor=COLORS['bg'])
     plt.close()
 
     print(f"\n  💾 比較チャート保存: {filename}")
@@ -598,13 +803,9 @@ def compare_stocks(tickers, period='1mo'):
     print(f"  {'─' * 44}")
     for ticker, data in all_data.items():
         latest = data['Close'].iloc[-1]
-        ret = ((latest / data['Close'].iloc[0]) - 1) * 100
-        delta = data['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        rsi = (100 - (100 / (1 + rs))).iloc[-1]
-        print(f"  {ticker:<8} ${latest:>10.2f} {ret:>+10.2f}% {rsi:>8.1f}")
+        period_return = cum[ticker][1][-1]
+        latest_rsi = data['RSI'].iloc[-1]
+        print(f"  {ticker:<8} ${latest:>10.2f} {period_return:>+10.2f}% {latest_rsi:>8.1f}")
     print(f"{'═' * 60}\n")
 
     return True